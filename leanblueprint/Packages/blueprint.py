@@ -11,10 +11,18 @@ Options:
 
 You can also add options that will be passed to the dependency graph package.
 """
-import string
+import os
+from functools import cache
 from pathlib import Path
 
-from jinja2 import Template
+# pybase64 decodes large Dress artifacts several times faster than the
+# stdlib; fall back to base64 when it is not installed.
+try:
+    from pybase64 import b64decode as _b64decode
+except ImportError:
+    from base64 import b64decode as _b64decode
+
+from jinja2 import Environment
 from plasTeX import Command
 from plasTeX.Logging import getLogger
 from plasTeX.PackageResource import PackageCss, PackageJs, PackageTemplateDir
@@ -25,6 +33,61 @@ import re
 
 log = getLogger()
 
+# Compiled once at import time: these run on every Lean declaration processed.
+_DOCSTRING_RE = re.compile(r'/--.*?-/', re.DOTALL)
+_PROOF_MARKER_RE = re.compile(r':=\s*by\s*\n')
+_WS_RE = re.compile(r'[ \t\n]*')
+# Attributes without nested brackets, strippable in one C-level pass
+_SIMPLE_ATTR_RE = re.compile(r'@\[[^\[\]]*\][ \t\n]*')
+_NESTED_ATTR_RE = re.compile(r'@\[[^\]]*\[')
+
+
+def strip_attributes(text: str) -> str:
+    """
+    Strip @[...] attributes (can span multiple lines with nested brackets).
+
+    Handles nested brackets by matching balanced brackets.
+    """
+    # Fast path: most snippets have no attributes at all.
+    if '@[' not in text:
+        return text
+    # Attributes like @[simp] with no nested brackets are the common case
+    # and can be stripped entirely by the regex engine; the balanced-bracket
+    # walk below is only needed when an attribute contains a nested '['.
+    if _NESTED_ATTR_RE.search(text) is None:
+        return _SIMPLE_ATTR_RE.sub('', text)
+    result = []
+    i = 0
+    n = len(text)
+    while i < n:
+        # Jump straight to the next attribute; everything before it is
+        # copied in a single slice instead of character by character.
+        start = text.find('@[', i)
+        if start < 0:
+            result.append(text[i:])
+            break
+        result.append(text[i:start])
+        # Find matching closing bracket for the opening '[' after '@'
+        depth = 1  # Start at 1 because we've seen the opening '[' in '@['
+        j = start + 2  # Start after '@['
+        while j < n:
+            if text[j] == '[':
+                depth += 1
+            elif text[j] == ']':
+                depth -= 1
+                if depth == 0:
+                    break
+            j += 1
+        if depth == 0:
+            # Found matching bracket, skip past the attribute and any
+            # trailing whitespace/newlines
+            i = _WS_RE.match(text, j + 1).end()
+        else:
+            # No matching bracket found, keep the '@' and keep scanning
+            result.append('@')
+            i = start + 1
+    return ''.join(result)
+
 
 def clean_lean_source(source: str) -> tuple[str, str | None]:
     """
@@ -36,40 +99,10 @@ def clean_lean_source(source: str) -> tuple[str, str | None]:
     Returns:
         (signature, proof_body) tuple where proof_body is None for definitions
     """
-    # Strip /-- ... -/ docstrings (can span multiple lines)
-    cleaned = re.sub(r'/--.*?-/', '', source, flags=re.DOTALL)
-
-    # Strip @[...] attributes (can span multiple lines with nested brackets)
-    # Handle nested brackets by matching balanced brackets
-    def strip_attributes(text: str) -> str:
-        result = []
-        i = 0
-        while i < len(text):
-            if text[i:i+2] == '@[':
-                # Find matching closing bracket for the opening '[' after '@'
-                depth = 1  # Start at 1 because we've seen the opening '[' in '@['
-                j = i + 2  # Start after '@['
-                while j < len(text):
-                    if text[j] == '[':
-                        depth += 1
-                    elif text[j] == ']':
-                        depth -= 1
-                        if depth == 0:
-                            # Found matching bracket, skip past the attribute
-                            i = j + 1
-                            # Skip any trailing whitespace/newlines
-                            while i < len(text) and text[i] in ' \t\n':
-                                i += 1
-                            break
-                    j += 1
-                else:
-                    # No matching bracket found, keep the character
-                    result.append(text[i])
-                    i += 1
-            else:
-                result.append(text[i])
-                i += 1
-        return ''.join(result)
+    # Strip /-- ... -/ docstrings (can span multiple lines). The substring
+    # check is much cheaper than the regex engine on the common
+    # docstring-free snippet; strip_attributes guards itself the same way.
+    cleaned = _DOCSTRING_RE.sub('', source) if '/--' in source else source
 
     cleaned = strip_attributes(cleaned)
 
@@ -78,20 +111,55 @@ def clean_lean_source(source: str) -> tuple[str, str | None]:
 
     # Split signature from proof body by looking for := by pattern
     # The pattern `:= by\n` indicates a tactic proof
-    match = re.search(r':=\s*by\s*\n', cleaned)
+    match = _PROOF_MARKER_RE.search(cleaned)
     if match:
-        signature = cleaned[:match.end()].rstrip()
-        proof_body = cleaned[match.end():]
-        # Strip leading/trailing whitespace from proof body
-        proof_body = proof_body.strip() if proof_body.strip() else None
-        return (signature, proof_body)
+        # Trim whitespace by index so signature and proof body are each
+        # sliced exactly once instead of slice-then-strip copying them twice
+        k = match.end()
+        sig_end = k
+        while sig_end > 0 and cleaned[sig_end - 1].isspace():
+            sig_end -= 1
+        proof_start = k
+        proof_end = len(cleaned)
+        while proof_start < proof_end and cleaned[proof_start].isspace():
+            proof_start += 1
+        while proof_end > proof_start and cleaned[proof_end - 1].isspace():
+            proof_end -= 1
+        proof_body = cleaned[proof_start:proof_end] if proof_end > proof_start else None
+        return (cleaned[:sig_end], proof_body)
 
     # For definitions (no := by pattern), return full cleaned source as signature
     return (cleaned, None)
 
+
+def clean_lean_signature(source: str) -> str:
+    """
+    Like clean_lean_source, but only return the signature.
+
+    Callers that discard the proof body can use this to skip slicing and
+    stripping it.
+    """
+    cleaned = _DOCSTRING_RE.sub('', source) if '/--' in source else source
+    cleaned = strip_attributes(cleaned).strip()
+    match = _PROOF_MARKER_RE.search(cleaned)
+    if match:
+        return cleaned[:match.end()].rstrip()
+    return cleaned
+
 PKG_DIR = Path(__file__).parent
 STATIC_DIR = Path(__file__).parent.parent/'static'
 
+# (source userdata key, rendered userdata key, source macro, rendered macro):
+# whenever the SubVerso JSON is present, the pre-rendered HTML must be too.
+_DRESS_REQUIREMENTS = (
+    ('leansource_base64', 'lean_source_html',
+     '\\leansource', '\\leansourcehtml'),
+    ('leansignature_base64', 'lean_signature_html',
+     '\\leansignaturesource', '\\leansignaturesourcehtml'),
+    ('leanproof_base64', 'lean_proof_html',
+     '\\leanproofsource', '\\leanproofsourcehtml'),
+)
+
 
 class home(Command):
     r"""\home{url}"""
@@ -196,16 +264,20 @@ class leanposition(Command):
     def digest(self, tokens):
         Command.digest(self, tokens)
         pos_str = self.attributes['position']
-        # Parse the pipe-separated position data
-        parts = pos_str.split('|')
-        if len(parts) == 5:
-            self.parentNode.setUserData('lean_position', {
-                'file': parts[0],
-                'start_line': int(parts[1]),
-                'start_col': int(parts[2]),
-                'end_line': int(parts[3]),
-                'end_col': int(parts[4])
-            })
+        # Parse the pipe-separated position data; malformed input is the
+        # cold path, so unpack first and only then check for failure
+        try:
+            file_path, rest = pos_str.split('|', 1)
+            start_line, start_col, end_line, end_col = map(int, rest.split('|'))
+        except ValueError:
+            return
+        self.parentNode.setUserData('lean_position', {
+            'file': file_path,
+            'start_line': start_line,
+            'start_col': start_col,
+            'end_line': end_line,
+            'end_col': end_col
+        })
 
 
 class leansource(Command):
@@ -236,6 +308,21 @@ class leanproofsource(Command):
         self.parentNode.setUserData('leanproof_base64', self.attributes['source'])
 
 
+def _decode_and_color(node, encoded: str, key: str, command: str) -> None:
+    """
+    Decode a base64 Dress HTML artifact, apply rainbow bracket coloring and
+    comment highlighting, and store the result under ``key`` in ``node``'s
+    userdata. Shared by the three \leansourcehtml-style commands.
+    """
+    try:
+        html_str = _b64decode(encoded).decode('utf-8')
+        html_str = _renumber_brackets_by_depth(html_str)
+        html_str = _highlight_comments_in_html(html_str)
+        node.setUserData(key, html_str)
+    except Exception as e:
+        raise RuntimeError(f'Failed to decode Dress artifact \\{command}: {e}') from e
+
+
 class leansourcehtml(Command):
     r"""\leansourcehtml{base64_encoded_html}
 
@@ -245,18 +332,10 @@ class leansourcehtml(Command):
     args = 'source:str'
 
     def digest(self, tokens):
-        import base64
         Command.digest(self, tokens)
         # Decode base64 HTML directly - no SubVerso rendering needed!
-        try:
-            html_bytes = base64.b64decode(self.attributes['source'])
-            html_str = html_bytes.decode('utf-8')
-            # Apply rainbow bracket coloring and comment highlighting
-            html_str = _renumber_brackets_by_depth(html_str)
-            html_str = _highlight_comments_in_html(html_str)
-            self.parentNode.setUserData('lean_source_html', html_str)
-        except Exception as e:
-            raise RuntimeError(f'Failed to decode Dress artifact \\leansourcehtml: {e}') from e
+        _decode_and_color(self.parentNode, self.attributes['source'],
+                          'lean_source_html', 'leansourcehtml')
 
 
 class leansignaturesourcehtml(Command):
@@ -268,17 +347,9 @@ class leansignaturesourcehtml(Command):
     args = 'source:str'
 
     def digest(self, tokens):
-        import base64
         Command.digest(self, tokens)
-        try:
-            html_bytes = base64.b64decode(self.attributes['source'])
-            html_str = html_bytes.decode('utf-8')
-            # Apply rainbow bracket coloring and comment highlighting
-            html_str = _renumber_brackets_by_depth(html_str)
-            html_str = _highlight_comments_in_html(html_str)
-            self.parentNode.setUserData('lean_signature_html', html_str)
-        except Exception as e:
-            raise RuntimeError(f'Failed to decode Dress artifact \\leansignaturesourcehtml: {e}') from e
+        _decode_and_color(self.parentNode, self.attributes['source'],
+                          'lean_signature_html', 'leansignaturesourcehtml')
 
 
 class leanproofsourcehtml(Command):
@@ -290,17 +361,9 @@ class leanproofsourcehtml(Command):
     args = 'source:str'
 
     def digest(self, tokens):
-        import base64
         Command.digest(self, tokens)
-        try:
-            html_bytes = base64.b64decode(self.attributes['source'])
-            html_str = html_bytes.decode('utf-8')
-            # Apply rainbow bracket coloring and comment highlighting
-            html_str = _renumber_brackets_by_depth(html_str)
-            html_str = _highlight_comments_in_html(html_str)
-            self.parentNode.setUserData('lean_proof_html', html_str)
-        except Exception as e:
-            raise RuntimeError(f'Failed to decode Dress artifact \\leanproofsourcehtml: {e}') from e
+        _decode_and_color(self.parentNode, self.attributes['source'],
+                          'lean_proof_html', 'leanproofsourcehtml')
 
 
 class leanhoverdata(Command):
@@ -308,15 +371,18 @@ class leanhoverdata(Command):
 
     Hover data JSON mapping hover IDs to their HTML content.
     Used by JavaScript to display type info on hover.
+
+    The JSON is never parsed in Python: it goes straight into a
+    single-quoted data attribute in Thms.jinja2s, so single quotes are
+    escaped here once instead of by a filter on every render.
     """
     args = 'data:str'
 
     def digest(self, tokens):
-        import base64
         Command.digest(self, tokens)
         try:
-            json_bytes = base64.b64decode(self.attributes['data'])
-            json_str = json_bytes.decode('utf-8')
+            json_bytes = _b64decode(self.attributes['data'])
+            json_str = json_bytes.decode('utf-8').replace("'", '&#39;')
             self.parentNode.setUserData('lean_hover_data', json_str)
         except Exception as e:
             raise RuntimeError(f'Failed to decode Dress artifact \\leanhoverdata: {e}') from e
@@ -328,15 +394,18 @@ class leanposition(Command):
 
     def digest(self, tokens):
         Command.digest(self, tokens)
-        parts = self.attributes['position'].split('|')
-        if len(parts) == 5:
-            self.parentNode.setUserData('leanposition', {
-                'file': parts[0],
-                'startLine': int(parts[1]),
-                'startCol': int(parts[2]),
-                'endLine': int(parts[3]),
-                'endCol': int(parts[4])
-            })
+        try:
+            file_path, rest = self.attributes['position'].split('|', 1)
+            start_line, start_col, end_line, end_col = map(int, rest.split('|'))
+        except ValueError:
+            return
+        self.parentNode.setUserData('leanposition', {
+            'file': file_path,
+            'startLine': start_line,
+            'startCol': start_col,
+            'endLine': end_line,
+            'endCol': end_col
+        })
 
 
 class leanproofposition(Command):
@@ -345,66 +414,87 @@ class leanproofposition(Command):
 
     def digest(self, tokens):
         Command.digest(self, tokens)
-        parts = self.attributes['position'].split('|')
-        if len(parts) == 5:
-            self.parentNode.setUserData('leanproofposition', {
-                'file': parts[0],
-                'startLine': int(parts[1]),
-                'startCol': int(parts[2]),
-                'endLine': int(parts[3]),
-                'endCol': int(parts[4])
-            })
-
-
-CHECKMARK_TPL = Template("""
-    {% if obj.userdata.leanok and ('proved_by' not in obj.userdata or obj.userdata.proved_by.userdata.leanok ) %}
+        try:
+            file_path, rest = self.attributes['position'].split('|', 1)
+            start_line, start_col, end_line, end_col = map(int, rest.split('|'))
+        except ValueError:
+            return
+        self.parentNode.setUserData('leanproofposition', {
+            'file': file_path,
+            'startLine': start_line,
+            'startCol': start_col,
+            'endLine': end_line,
+            'endCol': end_col
+        })
+
+
+# All module templates share one Environment so lexer, parser and compiled
+# filter/global state are set up a single time at import.
+_JINJA_ENV = Environment(autoescape=False, auto_reload=False)
+
+# Each template is compiled on first use (and cached): importing this
+# module for its helpers, as the Dress CLI does, should not pay for
+# compiling templates only ProcessOptions needs.
+
+@cache
+def _checkmark_tpl():
+    return _JINJA_ENV.from_string("""
+    {%- set ud = obj.userdata -%}
+    {% if ud.leanok and ('proved_by' not in ud or ud.proved_by.userdata.leanok ) %}
     ✓
     {% endif %}
 """)
 
-LEAN_DECLS_TPL = Template("""
+@cache
+def _lean_decls_tpl():
+    return _JINJA_ENV.from_string("""
     {% if obj.userdata.leandecls %}
     <button class="modal lean">L∃∀N</button>
     {% call modal('Lean declarations') %}
         <ul class="uses">
-          {% for lean, url in obj.userdata.lean_urls %}
-          <li><a href="{{ url }}" class="lean_decl">{{ lean }}</a></li>
-          {% endfor %}
+          {{ obj.userdata.lean_urls_html }}
         </ul>
     {% endcall %}
     {% endif %}
 """)
 
-GITHUB_ISSUE_TPL = Template("""
+@cache
+def _github_issue_tpl():
+    return _JINJA_ENV.from_string("""
     {% if obj.userdata.issue %}
     <a class="github_link" href="{{ obj.ownerDocument.userdata.project_github }}/issues/{{ obj.userdata.issue }}">Discussion</a>
     {% endif %}
 """)
 
-LEAN_LINKS_TPL = Template("""
-  {% if thm.userdata['lean_urls'] -%}
-    {%- if thm.userdata['lean_urls']|length > 1 -%}
+@cache
+def _lean_links_tpl():
+    return _JINJA_ENV.from_string("""
+  {%- set urls = thm.userdata['lean_urls'] -%}
+  {% if urls -%}
+    {%- if urls|length > 1 -%}
   <div class="tooltip">
       <span class="lean_link">Lean</span>
       <ul class="tooltip_list">
-        {% for name, url in thm.userdata['lean_urls'] %}
-           <li><a href="{{ url }}" class="lean_decl">{{ name }}</a></li>
-        {% endfor %}
+        {{ thm.userdata['lean_urls_html'] }}
       </ul>
   </div>
     {%- else -%}
-    <a class="lean_link lean_decl" href="{{ thm.userdata['lean_urls'][0][1] }}">Lean</a>
+    <a class="lean_link lean_decl" href="{{ urls[0][1] }}">Lean</a>
     {%- endif -%}
     {%- endif -%}
 """)
 
-GITHUB_LINK_TPL = Template("""
+@cache
+def _github_link_tpl():
+    return _JINJA_ENV.from_string("""
   {% if thm.userdata['issue'] -%}
   <a class="issue_link" href="{{ document.userdata['project_github'] }}/issues/{{ thm.userdata['issue'] }}">Discussion</a>
   {%- endif -%}
 """)
 
-LEAN_SOURCE_TPL = Template("""
+@cache
+def _lean_source_tpl():
+    return _JINJA_ENV.from_string("""
 {% if obj.userdata.lean_source_html %}
 <div class="lean-source-panel">
     <div class="lean-source-header">
@@ -443,7 +533,9 @@ def ProcessOptions(options, document):
 
     jobname = document.userdata['jobname']
     outdir = document.config['files']['directory']
-    outdir = string.Template(outdir).substitute({'jobname': jobname})
+    # The only placeholder ever used here is $jobname, so plain replacement
+    # beats building a string.Template.
+    outdir = outdir.replace('${jobname}', jobname).replace('$jobname', jobname)
 
     def make_lean_data() -> None:
         """
@@ -453,112 +545,133 @@ def ProcessOptions(options, document):
 
         project_dochome = document.userdata.get('project_dochome',
                                                 'https://leanprover-community.github.io/mathlib4_docs')
+        doc_prefix = f'{project_dochome}/find/#doc/'
+
+        # The working directory is typically blueprint/src, so the project
+        # root is two levels up. Computed once: it does not vary per node.
+        working_dir = Path(document.userdata.get('working-dir', ''))
+        project_root_str = str(working_dir.parent.parent) + os.sep
+        project_github = document.userdata.get('project_github')
 
         for graph in document.userdata['dep_graph']['graphs'].values():
             nodes = graph.nodes
+            # Precomputed so the can_state/can_prove checks below mostly hit
+            # a dict instead of per-theorem attribute walks. \uses targets
+            # are not all in this graph (they cross sections when depgraph
+            # builds one graph per section, and may name environments
+            # outside thm_types), so missing theorems fall back to their
+            # own userdata and are memoized on first sight.
+            leanok_of = {n: n.userdata.get('leanok') for n in nodes}
+
+            def leanok(thm):
+                if thm in leanok_of:
+                    return leanok_of[thm]
+                value = leanok_of[thm] = thm.userdata.get('leanok')
+                return value
             for node in nodes:
-                leandecls = node.userdata.get('leandecls', [])
-                lean_urls = []
-                for leandecl in leandecls:
-                    lean_urls.append(
-                        (leandecl,
-                         f'{project_dochome}/find/#doc/{leandecl}'))
-
-                node.userdata['lean_urls'] = lean_urls
+                ud = node.userdata
+                leandecls = ud.get('leandecls', [])
+                lean_urls = [(leandecl, doc_prefix + leandecl)
+                             for leandecl in leandecls]
+
+                ud['lean_urls'] = lean_urls
+                # The declaration list markup is identical in the theorem
+                # header modal and the dependency graph tooltip, and cheaper
+                # to build once here than in Jinja on every render.
+                ud['lean_urls_html'] = ''.join(
+                    f'<li><a href="{url}" class="lean_decl">{decl}</a></li>'
+                    for decl, url in lean_urls)
 
                 # Require Dress artifacts - no fallback rendering
                 # If SubVerso JSON is present but pre-rendered HTML is missing, error
-                if node.userdata.get('leansource_base64') and not node.userdata.get('lean_source_html'):
-                    raise RuntimeError(
-                        f"Missing Dress artifacts for {node}: found \\leansource but not \\leansourcehtml. "
-                        "Run Dress to generate pre-rendered HTML artifacts."
-                    )
-
-                if node.userdata.get('leansignature_base64') and not node.userdata.get('lean_signature_html'):
-                    raise RuntimeError(
-                        f"Missing Dress artifacts for {node}: found \\leansignaturesource but not \\leansignaturesourcehtml. "
-                        "Run Dress to generate pre-rendered HTML artifacts."
-                    )
-
-                if node.userdata.get('leanproof_base64') and not node.userdata.get('lean_proof_html'):
-                    raise RuntimeError(
-                        f"Missing Dress artifacts for {node}: found \\leanproofsource but not \\leanproofsourcehtml. "
-                        "Run Dress to generate pre-rendered HTML artifacts."
-                    )
+                for src_key, html_key, src_tex, html_tex in _DRESS_REQUIREMENTS:
+                    if src_key in ud and html_key not in ud:
+                        raise RuntimeError(
+                            f"Missing Dress artifacts for {node}: found {src_tex} but not {html_tex}. "
+                            "Run Dress to generate pre-rendered HTML artifacts."
+                        )
 
                 # Process leanposition: build GitHub permalink and fallback source display
-                if node.userdata.get('leanposition'):
-                    pos = node.userdata['leanposition']
-                    project_github = document.userdata.get('project_github')
+                if ud.get('leanposition'):
+                    pos = ud['leanposition']
                     if project_github:
-                        # Convert absolute path to relative path for GitHub
+                        # Convert absolute path to relative path for GitHub.
+                        # A prefix check is all we need: if the path is
+                        # already relative or lives elsewhere, use it as-is.
                         file_path = pos['file']
-                        # Try to make path relative by finding common project patterns
-                        # The working directory is typically blueprint/src, so project root is two levels up
-                        working_dir = Path(document.userdata.get('working-dir', ''))
-                        project_root = working_dir.parent.parent  # Go from blueprint/src to project root
-                        try:
-                            rel_path = Path(file_path).relative_to(project_root)
-                            file_path = str(rel_path)
-                        except ValueError:
-                            # If path is already relative or doesn't match, use as-is
-                            pass
+                        if file_path.startswith(project_root_str):
+                            file_path = file_path[len(project_root_str):]
                         # Build permalink with line range
                         # Default to 'main' branch - this could be made configurable
                         branch = 'main'
-                        node.userdata['lean_github_permalink'] = (
+                        ud['lean_github_permalink'] = (
                             f"{project_github}/blob/{branch}/{file_path}"
                             f"#L{pos['startLine']}-L{pos['endLine']}"
                         )
 
                     # Require Dress artifacts when position data is present
                     # File reading fallback is no longer supported - use Dress
-                    if not node.userdata.get('lean_signature_html'):
+                    if not ud.get('lean_signature_html'):
                         raise RuntimeError(
                             f"Missing Dress artifacts for {node}: found \\leanposition but not \\leansignaturesourcehtml. "
                             "Run Dress to generate pre-rendered HTML artifacts."
                         )
 
                 # Require Dress artifacts when proof position data is present
-                if node.userdata.get('leanproofposition') and not node.userdata.get('lean_proof_html'):
+                if ud.get('leanproofposition') and not ud.get('lean_proof_html'):
                     raise RuntimeError(
                         f"Missing Dress artifacts for {node}: found \\leanproofposition but not \\leanproofsourcehtml. "
                         "Run Dress to generate pre-rendered HTML artifacts."
                     )
 
-                used = node.userdata.get('uses', [])
-                node.userdata['can_state'] = all(thm.userdata.get('leanok')
-                                                 for thm in used) and not node.userdata.get('notready', False)
-                proof = node.userdata.get('proved_by')
+                used = ud.get('uses', [])
+                stated_ok = all(map(leanok, used))
+                ud['can_state'] = stated_ok and not ud.get('notready', False)
+                proof = ud.get('proved_by')
                 if proof:
-                    used.extend(proof.userdata.get('uses', []))
-                    node.userdata['can_prove'] = all(thm.userdata.get('leanok')
-                                                     for thm in used)
-                    node.userdata['proved'] = proof.userdata.get(
+                    # Only the proof's own prerequisites still need scanning:
+                    # the statement ones were checked just above. This also
+                    # stops extending the node's 'uses' list as a side effect.
+                    ud['can_prove'] = stated_ok and all(
+                        map(leanok, proof.userdata.get('uses', [])))
+                    ud['proved'] = proof.userdata.get(
                         'leanok', False)
                 else:
-                    node.userdata['can_prove'] = False
-                    node.userdata['proved'] = False
-
-            # Link proof nodes to parent theorems: pass lean_proof_html to proof nodes
-            for node in nodes:
-                if node.userdata.get('lean_proof_html'):
-                    proof = node.userdata.get('proved_by')
-                    if proof:
-                        proof.userdata['lean_proof_from_parent'] = node.userdata['lean_proof_html']
+                    ud['can_prove'] = False
+                    ud['proved'] = False
 
-            # Mark proofs that have a parent theorem - they'll be rendered inline
+            # Link proof nodes to parent theorems: pass lean_proof_html to
+            # proof nodes, and mark them so they'll be rendered inline
             for node in nodes:
                 proof = node.userdata.get('proved_by')
                 if proof:
+                    if node.userdata.get('lean_proof_html'):
+                        proof.userdata['lean_proof_from_parent'] = node.userdata['lean_proof_html']
                     proof.userdata['rendered_inline'] = True
 
+            # A node is fully proved when it is proved (or a definition) and
+            # so are all of its ancestors. Propagating through direct
+            # predecessors with memoization visits each node and edge once,
+            # instead of scanning the whole ancestor set of every node.
+            fully_proved_memo = {}
+
+            def fully_proved(n) -> bool:
+                cached = fully_proved_memo.get(n)
+                if cached is None:
+                    ok = n.userdata.get('proved', False) or item_kind(n) == 'definition'
+                    if n in nodes:
+                        ok = ok and all(map(fully_proved, graph.predecessors(n)))
+                    fully_proved_memo[n] = cached = ok
+                return cached
+
             for node in nodes:
-                node.userdata['fully_proved'] = all(n.userdata.get('proved', False) or item_kind(
-                    n) == 'definition' for n in graph.ancestors(node).union({node}))
+                node.userdata['fully_proved'] = fully_proved(node)
 
+        # Deduplicate while keeping first-seen order: declarations referred
+        # to from several places would otherwise repeat in the file.
+        decls = dict.fromkeys(document.userdata.get("lean_decls", []))
         lean_decls_path = Path(document.userdata['working-dir']).parent/"lean_decls"
-        lean_decls_path.write_text("\n".join(document.userdata.get("lean_decls", [])))
+        lean_decls_path.write_text("\n".join(decls))
 
     document.addPostParseCallbacks(150, make_lean_data)
 
@@ -649,11 +762,11 @@ def ProcessOptions(options, document):
     document.addPostParseCallbacks(150, make_legend)
 
     document.userdata.setdefault(
-        'thm_header_extras_tpl', []).extend([CHECKMARK_TPL])
-    document.userdata.setdefault('thm_header_hidden_extras_tpl', []).extend([LEAN_DECLS_TPL,
-                                                                             GITHUB_ISSUE_TPL])
+        'thm_header_extras_tpl', []).extend([_checkmark_tpl()])
+    document.userdata.setdefault('thm_header_hidden_extras_tpl', []).extend([_lean_decls_tpl(),
+                                                                             _github_issue_tpl()])
     document.userdata['dep_graph'].setdefault('extra_modal_links_tpl', []).extend([
-        LEAN_LINKS_TPL, GITHUB_LINK_TPL])
+        _lean_links_tpl(), _github_link_tpl()])
 
     # Note: Lean source panel is now rendered directly in Thms.jinja2s template
     # via sbs-statement-grid, so we no longer register LEAN_SOURCE_TPL here
@@ -7,10 +7,11 @@ syntax-highlighted Lean code with semantic information.
 
 The JSON format follows Lean's ToJson serialization for inductive types.
 """
-import json
-import base64
 import re
+from base64 import b64decode as _b64decode
+from functools import lru_cache
 from html import escape as html_escape
+from json import loads as _json_loads
 from typing import Any, Optional
 
 
@@ -31,6 +32,61 @@ LEXICAL_PATTERNS = [
 OPENING_BRACKETS = '([{⟨⟦'
 CLOSING_BRACKETS = ')]}⟩⟧'
 
+# Existing lean-bracket-X wrapper spans, removed before renumbering by depth
+_BRACKET_SPAN_RE = re.compile(r'<span class="lean-bracket-\d+">(.)</span>')
+
+# Message severity ranking for spans; the most severe attached kind
+# decides the CSS class, indexed by severity + 1 (so -1 = no messages).
+_SEVERITY = {"error": 2, "warning": 1, "info": 0}
+_SPAN_CLASSES = (
+    "lean-span",
+    "lean-span lean-info",
+    "lean-span lean-warning",
+    "lean-span lean-error",
+)
+
+# Fixed HTML layouts, precompiled as %-format strings: formatting into a
+# constant template is cheaper than rebuilding the literal pieces per call.
+_TACTIC_TMPL = (
+    '<span class="lean-tactic" data-goals="%s">%s</span>'
+    '<span class="lean-goals" id="%s" style="display:none;">%s</span>'
+)
+_CONCLUSION_TMPL = (
+    '<div class="lean-conclusion"><span class="lean-turnstile">%s</span>%s</div>'
+)
+_HYP_TMPL = (
+    '<div class="lean-hypothesis"><span class="lean-hyp-names">%s</span>'
+    '<span class="lean-hyp-colon"> : </span>'
+    '<span class="lean-hyp-type">%s</span></div>'
+)
+
+# Characters that html.escape would rewrite; most Lean tokens contain none
+# of them, so escaping can be skipped entirely in the common case.
+_ESCAPE_RE = re.compile(r'[&<>"\']')
+
+
+def _esc(s: str) -> str:
+    """html.escape with a fast path for strings with no sensitive chars."""
+    return s if _ESCAPE_RE.search(s) is None else html_escape(s)
+
+# Token.Kind constructor name -> CSS class (see _token_class for the list)
+_KIND_TO_CLASS = {
+    "keyword": "lean-keyword",
+    "const": "lean-const",
+    "anonCtor": "lean-const",
+    "var": "lean-var",
+    "str": "lean-string",
+    "option": "lean-option",
+    "docComment": "lean-docstring",
+    "sort": "lean-sort",
+    "levelVar": "lean-level",
+    "levelOp": "lean-level",
+    "levelConst": "lean-level",
+    "moduleName": "lean-module",
+    "withType": "lean-expr",
+    "unknown": "lean-text",
+}
+
 
 def _highlight_brackets_with_depth(text: str) -> str:
     """Highlight brackets with depth-based rainbow colors (6 colors cycling)."""
@@ -134,7 +190,7 @@ def _renumber_brackets_by_depth(html: str) -> str:
     """
     # First, remove any existing lean-bracket-X wrapper spans
     # (keeps the bracket character, removes the span)
-    html = re.sub(r'<span class="lean-bracket-\d+">(.)</span>', r'\1', html)
+    html = _BRACKET_SPAN_RE.sub(r'\1', html)
 
     # Now walk through and wrap all brackets with correct depth
     result = []
@@ -186,23 +242,28 @@ def render_highlighted(highlighted_json: str) -> str:
     Returns:
         HTML string with syntax highlighting via CSS classes.
     """
-    data = json.loads(highlighted_json)
+    data = _json_loads(highlighted_json)
     html = _render_node(data)
     # Post-process to fix bracket depth across token boundaries
     return _renumber_brackets_by_depth(html)
 
 
+@lru_cache(maxsize=4096)
 def render_highlighted_base64(encoded: str) -> str:
     """
     Decode base64-encoded Highlighted JSON and render to HTML.
 
+    Results are memoized: blueprints pass the same encoded fragments for
+    repeated declarations and across LaTeX passes, and a cache hit skips
+    the decode, JSON parse and tree walk entirely.
+
     Args:
         encoded: Base64-encoded JSON string (commonly passed from LaTeX).
 
     Returns:
         HTML string with syntax highlighting via CSS classes.
     """
-    decoded = base64.b64decode(encoded).decode('utf-8')
+    decoded = _b64decode(encoded).decode('utf-8')
     return render_highlighted(decoded)
 
 
@@ -219,76 +280,83 @@ def _render_node(node: Any) -> str:
     - point: A zero-width annotation point
     - unparsed: Unparsed text (treated as plain text)
 
+    Sequences (lists and seq nodes) are walked with an explicit stack
+    rather than one Python frame per child: a long proof can produce tens
+    of thousands of seq children, and iteration keeps their cost to a
+    list push/pop each. Constructors that bracket their children in HTML
+    (span, tactics) still recurse through their handlers.
+
     Args:
         node: A deserialized JSON node representing part of the Highlighted structure.
 
     Returns:
         HTML string for this node.
     """
-    if node is None:
-        return ""
+    out = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+
+        if node is None:
+            continue
+
+        # Handle primitive string (plain text)
+        if isinstance(node, str):
+            out.append(_esc(node))
+            continue
+
+        # Handle arrays (sequences): push children instead of recursing
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+            continue
+
+        # Handle objects with tagged constructors
+        if not isinstance(node, dict):
+            out.append(str(node))
+            continue
+
+        # Lean's ToJson for inductive types uses tagged format: there is
+        # typically exactly one constructor key, so a single dict lookup in
+        # the handler table replaces a cascade of membership tests.
+        for key, value in node.items():
+            if key == "seq":
+                stack.extend(reversed(_unwrap(value, "highlights")))
+                break
+            handler = _NODE_HANDLERS.get(key)
+            if handler is not None:
+                out.append(handler(value))
+                break
+        else:
+            # Fallback: if node has content directly (for some serialization formats)
+            if "kind" in node and "content" in node:
+                out.append(_render_token(node))
+            # Unknown structure - render nothing
+
+    return "".join(out)
+
+
+def _unwrap(data: Any, key: str) -> Any:
+    """
+    Strip SubVerso's wrapped payload format.
+
+    Depending on the serializer version, constructor payloads arrive either
+    bare or wrapped in a one-field structure: {"token": {"tok": X}},
+    {"text": {"str": X}}, {"seq": {"highlights": X}}. Returns the inner
+    value if wrapped, the payload unchanged otherwise.
+    """
+    if isinstance(data, dict) and key in data:
+        return data[key]
+    return data
+
+
+def _handle_token(token_data: Any) -> str:
+    """token: {"tok": {"kind": {...}, "content": "..."}} or {"kind": ..., "content": ...}"""
+    return _render_token(_unwrap(token_data, "tok"))
 
-    # Handle primitive string (plain text)
-    if isinstance(node, str):
-        return html_escape(node)
-
-    # Handle arrays (sequences)
-    if isinstance(node, list):
-        return "".join(_render_node(child) for child in node)
-
-    # Handle objects with tagged constructors
-    if not isinstance(node, dict):
-        return str(node)
-
-    # Lean's ToJson for inductive types uses tagged format
-    # The structure varies based on the constructor
-
-    # token: {"token": {"tok": {"kind": {...}, "content": "..."}}} or {"token": {"kind": ..., "content": ...}}
-    if "token" in node:
-        token_data = node["token"]
-        # Handle wrapped format: {"token": {"tok": {...}}}
-        if isinstance(token_data, dict) and "tok" in token_data:
-            token_data = token_data["tok"]
-        return _render_token(token_data)
-
-    # text: {"text": "..."} or {"text": {"str": "..."}}
-    if "text" in node:
-        text_data = node["text"]
-        # Handle wrapped format: {"text": {"str": "..."}}
-        if isinstance(text_data, dict) and "str" in text_data:
-            text_data = text_data["str"]
-        return _highlight_plain_text(text_data)
-
-    # seq: {"seq": [...]} or {"seq": {"highlights": [...]}}
-    if "seq" in node:
-        seq_data = node["seq"]
-        # Handle wrapped format: {"seq": {"highlights": [...]}}
-        if isinstance(seq_data, dict) and "highlights" in seq_data:
-            seq_data = seq_data["highlights"]
-        return "".join(_render_node(child) for child in seq_data)
-
-    # span: {"span": {"info": [...], "content": {...}}}
-    if "span" in node:
-        return _render_span(node["span"])
-
-    # tactics: {"tactics": {"info": [...], "startPos": n, "endPos": m, "content": {...}}}
-    if "tactics" in node:
-        return _render_tactics(node["tactics"])
-
-    # point: {"point": {"kind": "...", "info": {...}}}
-    if "point" in node:
-        return _render_point(node["point"])
-
-    # unparsed: {"unparsed": "..."}
-    if "unparsed" in node:
-        return _highlight_plain_text(node["unparsed"])
-
-    # Fallback: if node has content directly (for some serialization formats)
-    if "kind" in node and "content" in node:
-        return _render_token(node)
-
-    # Unknown structure - return empty
-    return ""
+
+def _handle_text(text_data: Any) -> str:
+    """text: "..." or {"str": "..."}"""
+    return _highlight_plain_text(_unwrap(text_data, "str"))
 
 
 def _render_token(token: dict) -> str:
@@ -308,30 +376,36 @@ def _render_token(token: dict) -> str:
     kind = token.get("kind", {})
     content = token.get("content", "")
 
-    css_class = _token_class(kind)
+    css_class, attrs = _classify_token(kind)
 
     # For unknown/text tokens, apply lexical highlighting (numbers, operators, etc.)
     # and return directly without wrapping in lean-text span
     if css_class == "lean-text":
         return _highlight_plain_text(content)
 
-    escaped_content = html_escape(content)
+    escaped_content = _esc(content)
 
-    # Check for sorry - special handling
-    if content.strip() == "sorry":
+    # Check for sorry - special handling. The substring gate runs at C
+    # speed and skips the strip allocation for the vast majority of
+    # tokens, which do not contain "sorry" at all.
+    if "sorry" in content and content.strip() == "sorry":
         css_class = "lean-sorry"
 
-    # Add data attributes for hover info if available
-    attrs = _token_data_attrs(kind)
-
     if css_class:
-        return f'<span class="{css_class}"{attrs}>{escaped_content}</span>'
+        # Single join over fragments; avoids intermediate f-string allocations
+        # in the hottest path of the renderer.
+        return "".join(
+            ('<span class="', css_class, '"', attrs, '>', escaped_content, '</span>')
+        )
     return escaped_content
 
 
-def _token_class(kind: Any) -> str:
+def _classify_token(kind: Any) -> tuple[str, str]:
     """
-    Map SubVerso Token.Kind to CSS class.
+    Map SubVerso Token.Kind to a CSS class and hover data attributes.
+
+    The class and the attributes both depend on the single constructor tag
+    of the kind, so they are extracted in one pass over it.
 
     Token.Kind constructors (from Highlighted.lean):
     - keyword: Keywords like 'def', 'theorem', 'where', etc.
@@ -353,190 +427,112 @@ def _token_class(kind: Any) -> str:
         kind: The Token.Kind object (may be a dict with constructor tag or string).
 
     Returns:
-        CSS class name (without 'lean-' prefix applied yet, that's added in return).
+        (CSS class name, HTML attribute string with leading space if non-empty).
     """
     if kind is None:
-        return "lean-text"
+        return "lean-text", ""
 
     # Handle string format (simple case)
     if isinstance(kind, str):
-        return _kind_string_to_class(kind)
-
-    # Handle dict format (tagged constructor)
-    if isinstance(kind, dict):
-        # Lean's ToJson for inductive uses the constructor name as key
-        # e.g., {"keyword": {"name": null, "occurrence": null, "docs": null}}
-        #       {"const": {"name": [...], "signature": "...", "docs": null, "isDef": false}}
-
-        if "keyword" in kind:
-            return "lean-keyword"
-
-        if "const" in kind:
-            const_data = kind["const"]
-            # Check if this is a definition site
-            if isinstance(const_data, dict) and const_data.get("isDef", False):
-                return "lean-const lean-def"
-            return "lean-const"
-
-        if "anonCtor" in kind:
-            return "lean-const"
-
-        if "var" in kind:
-            return "lean-var"
-
-        if "str" in kind:
-            return "lean-string"
-
-        if "option" in kind:
-            return "lean-option"
-
-        if "docComment" in kind:
-            return "lean-docstring"
-
-        if "sort" in kind:
-            return "lean-sort"
-
-        if "levelVar" in kind:
-            return "lean-level"
-
-        if "levelOp" in kind:
-            return "lean-level"
-
-        if "levelConst" in kind:
-            return "lean-level"
-
-        if "moduleName" in kind:
-            return "lean-module"
-
-        if "withType" in kind:
-            return "lean-expr"
-
-        if "unknown" in kind:
-            return "lean-text"
-
-        # Check if kind itself is a simple string value stored differently
-        for key in kind:
-            if kind[key] is None or kind[key] == {}:
-                return _kind_string_to_class(key)
-
-    return "lean-text"
-
-
-def _kind_string_to_class(kind_name: str) -> str:
-    """Map a simple kind name string to CSS class."""
-    mapping = {
-        "keyword": "lean-keyword",
-        "const": "lean-const",
-        "anonCtor": "lean-const",
-        "var": "lean-var",
-        "str": "lean-string",
-        "option": "lean-option",
-        "docComment": "lean-docstring",
-        "sort": "lean-sort",
-        "levelVar": "lean-level",
-        "levelOp": "lean-level",
-        "levelConst": "lean-level",
-        "moduleName": "lean-module",
-        "withType": "lean-expr",
-        "unknown": "lean-text",
-    }
-    return mapping.get(kind_name, "lean-text")
+        return _KIND_TO_CLASS.get(kind, "lean-text"), ""
 
+    if not isinstance(kind, dict):
+        return "lean-text", ""
 
-def _token_data_attrs(kind: Any) -> str:
-    """
-    Extract data attributes for token hover information.
-
-    Args:
-        kind: The Token.Kind object.
+    # Handle dict format (tagged constructor)
+    # Lean's ToJson for inductive uses the constructor name as key
+    # e.g., {"keyword": {"name": null, "occurrence": null, "docs": null}}
+    #       {"const": {"name": [...], "signature": "...", "docs": null, "isDef": false}}
+    # There is exactly one such key, so extract it once and look it up.
+    key = next(iter(kind), None)
+    data = kind.get(key) if key is not None else None
+
+    if key == "const":
+        # Check if this is a definition site
+        if isinstance(data, dict) and data.get("isDef", False):
+            css_class = "lean-const lean-def"
+        else:
+            css_class = "lean-const"
+    else:
+        css_class = _KIND_TO_CLASS.get(key, "lean-text")
 
-    Returns:
-        HTML attribute string (with leading space if non-empty).
-    """
-    if not isinstance(kind, dict):
-        return ""
+    # Only constructors with hover payloads need the attr machinery;
+    # everything else returns before any list is allocated.
+    if not isinstance(data, dict):
+        return css_class, ""
 
     attrs = []
     title_parts = []  # For building hover tooltip
 
-    # Extract signature and docs for constants
-    if "const" in kind:
-        const_data = kind["const"]
-        if isinstance(const_data, dict):
-            name = const_data.get("name")
-            name_str = _name_to_string(name) if name else None
-            sig = const_data.get("signature")
-            docs = const_data.get("docs")
-
-            if name_str:
-                attrs.append(f'data-name="{html_escape(name_str)}"')
-            if sig:
-                attrs.append(f'data-signature="{html_escape(sig)}"')
-                title_parts.append(sig)
-            if docs:
-                attrs.append(f'data-docs="{html_escape(docs)}"')
-                # Add abbreviated docs to title (first line or first 100 chars)
-                doc_preview = docs.split('\n')[0][:100]
-                if len(docs) > len(doc_preview):
-                    doc_preview += "..."
-                title_parts.append(doc_preview)
-
-    # Extract signature and docs for anonymous constructors
-    if "anonCtor" in kind:
-        ctor_data = kind["anonCtor"]
-        if isinstance(ctor_data, dict):
-            sig = ctor_data.get("signature")
-            docs = ctor_data.get("docs")
-            if sig:
-                attrs.append(f'data-signature="{html_escape(sig)}"')
-                title_parts.append(sig)
-            if docs:
-                attrs.append(f'data-docs="{html_escape(docs)}"')
-
-    # Extract type for variables
-    if "var" in kind:
-        var_data = kind["var"]
-        if isinstance(var_data, dict):
-            var_type = var_data.get("type")
-            if var_type:
-                attrs.append(f'data-type="{html_escape(var_type)}"')
-                title_parts.append(var_type)
-
-    # Extract docs for keywords
-    if "keyword" in kind:
-        kw_data = kind["keyword"]
-        if isinstance(kw_data, dict):
-            docs = kw_data.get("docs")
-            if docs:
-                attrs.append(f'data-docs="{html_escape(docs)}"')
-                title_parts.append(docs.split('\n')[0][:100])
-
-    # Extract docs for sort (Type, Prop, Sort)
-    if "sort" in kind:
-        sort_data = kind["sort"]
-        if isinstance(sort_data, dict):
-            docs = sort_data.get("doc?")
-            if docs:
-                attrs.append(f'data-docs="{html_escape(docs)}"')
-                title_parts.append(docs.split('\n')[0][:100])
-
-    # Extract type for withType expressions
-    if "withType" in kind:
-        wt_data = kind["withType"]
-        if isinstance(wt_data, dict):
-            expr_type = wt_data.get("type")
-            if expr_type:
-                attrs.append(f'data-type="{html_escape(expr_type)}"')
-                title_parts.append(expr_type)
+    if key == "const":
+        # Extract name, signature and docs for constants
+        name = data.get("name")
+        name_str = _name_to_string(name) if name else None
+        sig = data.get("signature")
+        docs = data.get("docs")
+
+        if name_str:
+            attrs.append(f'data-name="{_esc(name_str)}"')
+        if sig:
+            attrs.append(f'data-signature="{_esc(sig)}"')
+            title_parts.append(sig)
+        if docs:
+            attrs.append(f'data-docs="{_esc(docs)}"')
+            # Add abbreviated docs to title (first line or first 100 chars)
+            doc_preview = docs.split('\n')[0][:100]
+            if len(docs) > len(doc_preview):
+                doc_preview += "..."
+            title_parts.append(doc_preview)
+
+    elif key == "anonCtor":
+        # Extract signature and docs for anonymous constructors
+        sig = data.get("signature")
+        docs = data.get("docs")
+        if sig:
+            attrs.append(f'data-signature="{_esc(sig)}"')
+            title_parts.append(sig)
+        if docs:
+            attrs.append(f'data-docs="{_esc(docs)}"')
+
+    elif key == "var":
+        # Extract type for variables
+        var_type = data.get("type")
+        if var_type:
+            attrs.append(f'data-type="{_esc(var_type)}"')
+            title_parts.append(var_type)
+
+    elif key == "keyword":
+        # Extract docs for keywords
+        docs = data.get("docs")
+        if docs:
+            attrs.append(f'data-docs="{_esc(docs)}"')
+            title_parts.append(docs.split('\n')[0][:100])
+
+    elif key == "sort":
+        # Extract docs for sort (Type, Prop, Sort)
+        docs = data.get("doc?")
+        if docs:
+            attrs.append(f'data-docs="{_esc(docs)}"')
+            title_parts.append(docs.split('\n')[0][:100])
+
+    elif key == "withType":
+        # Extract type for withType expressions
+        expr_type = data.get("type")
+        if expr_type:
+            attrs.append(f'data-type="{_esc(expr_type)}"')
+            title_parts.append(expr_type)
+
+    else:
+        return css_class, ""
 
     # Build title attribute for native hover tooltip
     if title_parts:
         title = "\n".join(title_parts)
-        attrs.append(f'title="{html_escape(title)}"')
+        attrs.append(f'title="{_esc(title)}"')
 
     if attrs:
-        return " " + " ".join(attrs)
-    return ""
+        return css_class, " " + " ".join(attrs)
+    return css_class, ""
 
 
 def _name_to_string(name: Any) -> str:
@@ -579,11 +575,7 @@ def _render_span(span: dict) -> str:
     content = span.get("content", {})
 
     # Determine the most severe message type for CSS class
-    css_class = "lean-span"
-    has_error = False
-    has_warning = False
-    has_info = False
-
+    severity = -1
     for item in info:
         if isinstance(item, (list, tuple)) and len(item) >= 1:
             kind = item[0]
@@ -592,19 +584,15 @@ def _render_span(span: dict) -> str:
         else:
             kind = item
 
-        if kind == "error":
-            has_error = True
-        elif kind == "warning":
-            has_warning = True
-        elif kind == "info":
-            has_info = True
+        if isinstance(kind, str):
+            rank = _SEVERITY.get(kind, -1)
+            if rank > severity:
+                severity = rank
+                if severity == 2:
+                    # Nothing outranks an error
+                    break
 
-    if has_error:
-        css_class += " lean-error"
-    elif has_warning:
-        css_class += " lean-warning"
-    elif has_info:
-        css_class += " lean-info"
+    css_class = _SPAN_CLASSES[severity + 1]
 
     rendered_content = _render_node(content)
 
@@ -660,46 +648,67 @@ def _message_contents_to_string(msg: Any) -> str:
     Returns:
         Plain text representation.
     """
+    out: list = []
+    _message_contents_to_string_into(msg, out)
+    return "".join(out)
+
+
+def _message_contents_to_string_into(msg: Any, out: list) -> None:
+    """Append the plain-text fragments of a MessageContents node to out.
+
+    Accumulating into one shared list avoids the intermediate strings a
+    recursive join would build at every level of a nested trace.
+    """
     if msg is None:
-        return ""
+        return
 
     if isinstance(msg, str):
-        return msg
+        out.append(msg)
+        return
 
     if isinstance(msg, list):
-        return "".join(_message_contents_to_string(m) for m in msg)
+        for m in msg:
+            _message_contents_to_string_into(m, out)
+        return
 
     if not isinstance(msg, dict):
-        return str(msg)
-
-    # text: {"text": "..."}
-    if "text" in msg:
-        return msg["text"]
-
-    # append: {"append": [...]}
-    if "append" in msg:
-        return "".join(_message_contents_to_string(m) for m in msg["append"])
-
-    # goal: {"goal": {...}}
-    if "goal" in msg:
-        return _goal_to_string(msg["goal"])
-
-    # term: {"term": {...}}
-    if "term" in msg:
-        return _highlighted_to_string(msg["term"])
-
-    # trace: {"trace": {"cls": ..., "msg": ..., "children": [...], "collapsed": bool}}
-    if "trace" in msg:
-        trace = msg["trace"]
-        if isinstance(trace, dict):
-            result = _message_contents_to_string(trace.get("msg", ""))
-            children = trace.get("children", [])
-            if children and not trace.get("collapsed", True):
-                for child in children:
-                    result += "\n  " + _message_contents_to_string(child)
-            return result
+        out.append(str(msg))
+        return
+
+    # Tagged constructor: one handler-table lookup per key replaces the
+    # cascade of membership tests (same pattern as _render_node).
+    for key in msg:
+        handler = _MSG_HANDLERS.get(key)
+        if handler is not None:
+            handler(msg[key], out)
+            return
+
+
+def _msg_text_into(value: Any, out: list) -> None:
+    """text: {"text": "..."}"""
+    out.append(value)
+
+
+def _msg_append_into(values: Any, out: list) -> None:
+    """append: {"append": [...]}"""
+    for m in values:
+        _message_contents_to_string_into(m, out)
 
-    return ""
+
+def _msg_goal_into(value: Any, out: list) -> None:
+    """goal: {"goal": {...}}"""
+    out.append(_goal_to_string(value))
+
+
+def _msg_trace_into(trace: Any, out: list) -> None:
+    """trace: {"trace": {"cls": ..., "msg": ..., "children": [...], "collapsed": bool}}"""
+    if isinstance(trace, dict):
+        _message_contents_to_string_into(trace.get("msg", ""), out)
+        children = trace.get("children", [])
+        if children and not trace.get("collapsed", True):
+            for child in children:
+                out.append("\n  ")
+                _message_contents_to_string_into(child, out)
 
 
 def _goal_to_string(goal: dict) -> str:
@@ -762,41 +771,60 @@ def _highlighted_to_string(hl: Any) -> str:
     Returns:
         Plain text content.
     """
+    out: list = []
+    _highlighted_to_string_into(hl, out)
+    return "".join(out)
+
+
+def _highlighted_to_string_into(hl: Any, out: list) -> None:
+    """Append the plain-text content of a Highlighted node to out.
+
+    Leaf nodes do a single append; seq nodes recurse into the shared
+    accumulator instead of joining per level.
+    """
     if hl is None:
-        return ""
+        return
 
     if isinstance(hl, str):
-        return hl
+        out.append(hl)
+        return
 
     if isinstance(hl, list):
-        return "".join(_highlighted_to_string(item) for item in hl)
+        for item in hl:
+            _highlighted_to_string_into(item, out)
+        return
 
     if not isinstance(hl, dict):
-        return ""
+        return
 
     if "token" in hl:
         token = hl["token"]
-        return token.get("content", "") if isinstance(token, dict) else ""
+        if isinstance(token, dict):
+            out.append(token.get("content", ""))
+        return
 
     if "text" in hl:
-        return hl["text"]
+        out.append(hl["text"])
+        return
 
     if "seq" in hl:
-        return "".join(_highlighted_to_string(item) for item in hl["seq"])
+        for item in hl["seq"]:
+            _highlighted_to_string_into(item, out)
+        return
 
     if "span" in hl:
-        return _highlighted_to_string(hl["span"].get("content", {}))
+        _highlighted_to_string_into(hl["span"].get("content", {}), out)
+        return
 
     if "tactics" in hl:
-        return _highlighted_to_string(hl["tactics"].get("content", {}))
+        _highlighted_to_string_into(hl["tactics"].get("content", {}), out)
+        return
 
     if "point" in hl:
-        return ""
+        return
 
     if "unparsed" in hl:
-        return hl["unparsed"]
-
-    return ""
+        out.append(hl["unparsed"])
 
 
 def _render_tactics(tactics: dict) -> str:
@@ -832,14 +860,7 @@ def _render_tactics(tactics: dict) -> str:
     goals_html = _render_goals(info)
     goal_id = f"goal-{start_pos}-{end_pos}"
 
-    return (
-        f'<span class="lean-tactic" data-goals="{goal_id}">'
-        f'{rendered_content}'
-        f'</span>'
-        f'<span class="lean-goals" id="{goal_id}" style="display:none;">'
-        f'{goals_html}'
-        f'</span>'
-    )
+    return _TACTIC_TMPL % (goal_id, rendered_content, goal_id, goals_html)
 
 
 def _render_goals(goals: list) -> str:
@@ -877,7 +898,7 @@ def _render_goal(goal: dict, index: int, total: int) -> str:
     if not isinstance(goal, dict):
         return ""
 
-    parts = []
+    parts = ['<div class="lean-goal">']
 
     # Goal header
     name = goal.get("name")
@@ -885,9 +906,13 @@ def _render_goal(goal: dict, index: int, total: int) -> str:
         header = f"goal {index}/{total}"
         if name:
             header = f"case {name} ({index}/{total})"
-        parts.append(f'<div class="lean-goal-header">{html_escape(header)}</div>')
+        parts.append('<div class="lean-goal-header">')
+        parts.append(html_escape(header))
+        parts.append('</div>')
     elif name:
-        parts.append(f'<div class="lean-goal-header">case {html_escape(name)}</div>')
+        parts.append('<div class="lean-goal-header">case ')
+        parts.append(html_escape(name))
+        parts.append('</div>')
 
     # Hypotheses
     hypotheses = goal.get("hypotheses", [])
@@ -900,14 +925,10 @@ def _render_goal(goal: dict, index: int, total: int) -> str:
     # Conclusion
     prefix = goal.get("goalPrefix", "⊢ ")
     conclusion = goal.get("conclusion", {})
-    parts.append(
-        f'<div class="lean-conclusion">'
-        f'<span class="lean-turnstile">{html_escape(prefix)}</span>'
-        f'{_render_node(conclusion)}'
-        f'</div>'
-    )
+    parts.append(_CONCLUSION_TMPL % (html_escape(prefix), _render_node(conclusion)))
 
-    return f'<div class="lean-goal">{"".join(parts)}</div>'
+    parts.append('</div>')
+    return "".join(parts)
 
 
 def _render_hypothesis(hyp: dict) -> str:
@@ -936,18 +957,9 @@ def _render_hypothesis(hyp: dict) -> str:
         if isinstance(name_token, dict):
             name_parts.append(_render_token(name_token))
         elif isinstance(name_token, str):
-            name_parts.append(html_escape(name_token))
-
-    names_html = " ".join(name_parts)
-    type_html = _render_node(type_and_val)
+            name_parts.append(_esc(name_token))
 
-    return (
-        f'<div class="lean-hypothesis">'
-        f'<span class="lean-hyp-names">{names_html}</span>'
-        f'<span class="lean-hyp-colon"> : </span>'
-        f'<span class="lean-hyp-type">{type_html}</span>'
-        f'</div>'
-    )
+    return _HYP_TMPL % (" ".join(name_parts), _render_node(type_and_val))
 
 
 def _render_point(point: dict) -> str:
@@ -978,6 +990,31 @@ def _render_point(point: dict) -> str:
     return f'<span class="{css_class}"></span>'
 
 
+# Constructor-tag dispatch table for _message_contents_to_string_into;
+# each handler receives the value stored under the tag key plus the
+# shared output accumulator.
+_MSG_HANDLERS = {
+    "text": _msg_text_into,
+    "append": _msg_append_into,
+    "goal": _msg_goal_into,
+    "term": _highlighted_to_string_into,
+    "trace": _msg_trace_into,
+}
+
+
+# Constructor-tag dispatch table for _render_node; each handler receives the
+# value stored under the tag key. seq nodes are handled inline in
+# _render_node's stack loop rather than through a handler.
+_NODE_HANDLERS = {
+    "token": _handle_token,
+    "text": _handle_text,
+    "span": _render_span,
+    "tactics": _render_tactics,
+    "point": _render_point,
+    "unparsed": _highlight_plain_text,
+}
+
+
 # CSS for syntax highlighting - can be customized
 LEAN_HIGHLIGHT_CSS = """
 /* SubVerso Lean Syntax Highlighting */